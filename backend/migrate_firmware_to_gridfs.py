@@ -0,0 +1,56 @@
+"""One-shot migration: move base64 `file_data` firmware blobs into the GridFS bucket.
+
+Run from the backend directory with the same .env as the server:
+
+    python migrate_firmware_to_gridfs.py
+"""
+import asyncio
+import base64
+import hashlib
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from gridfs import AsyncGridFSBucket
+from pymongo import AsyncMongoClient
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+async def migrate():
+    client = AsyncMongoClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    bucket = AsyncGridFSBucket(db, bucket_name='firmware')
+    migrated = 0
+    try:
+        cursor = db.firmware_versions.find(
+            {'file_data': {'$exists': True}, 'gridfs_id': {'$exists': False}},
+            {'_id': 1, 'id': 1, 'version': 1, 'file_data': 1}
+        )
+        async for doc in cursor:
+            content = base64.b64decode(doc['file_data'])
+            gridfs_id = await bucket.upload_from_stream(f"{doc['id']}-{doc['version']}.bin", content)
+            try:
+                await db.firmware_versions.update_one(
+                    {'_id': doc['_id']},
+                    {
+                        '$set': {
+                            'gridfs_id': str(gridfs_id),
+                            'file_size': len(content),
+                            'sha256': hashlib.sha256(content).hexdigest()
+                        },
+                        '$unset': {'file_data': ''}
+                    }
+                )
+            except Exception:
+                await bucket.delete(gridfs_id)
+                raise
+            migrated += 1
+    finally:
+        await client.close()
+    print(f"Migrated {migrated} firmware version(s) to GridFS")
+
+
+if __name__ == '__main__':
+    asyncio.run(migrate())
@@ -1,37 +1,82 @@
 from fastapi import FastAPI, APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Depends, status, UploadFile, File, Form
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import AsyncMongoClient
+from pymongo.errors import BulkWriteError, CollectionInvalid, ConnectionFailure, DuplicateKeyError
+from gridfs import AsyncGridFSBucket
+from gridfs.errors import NoFile
+import bson
+from bson import ObjectId
+from bson.errors import InvalidDocument
 import os
+import asyncio
 import logging
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set
 import uuid
-from datetime import datetime, timezone, timedelta
-import bcrypt
-import jwt
-import json
 import base64
+from datetime import datetime, timezone
+import bcrypt
+import hmac
+import hashlib
+import time
+import orjson
+import zlib
+from cachetools import TTLCache
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncMongoClient(
+    mongo_url,
+    tz_aware=True,
+    maxPoolSize=50,
+    minPoolSize=10,  # keep warm connections so first requests skip the handshake
+    serverSelectionTimeoutMS=5000,
+    connectTimeoutMS=5000
+)
 db = client[os.environ['DB_NAME']]
+firmware_bucket = AsyncGridFSBucket(db, bucket_name='firmware')
+
+# Serves the latest-readings-per-device query in get_sensor_data
+SENSOR_DATA_INDEX = [("device_id", 1), ("timestamp", -1)]
 
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_HOURS = 24
 
+# Dashboard broadcasts are coalesced over this window and sent as one frame
+BROADCAST_BATCH_WINDOW = 0.02
+# Max frames queued per dashboard socket before a slow client is disconnected
+USER_QUEUE_SIZE = 100
+
+# OTA firmware is streamed to devices in binary frames of this size
+OTA_CHUNK_SIZE = 16 * 1024
+
+# Firmware uploads are read in chunks of this size and rejected above MAX_FIRMWARE_SIZE
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MAX_FIRMWARE_SIZE = int(os.environ.get('MAX_FIRMWARE_SIZE', str(16 * 1024 * 1024)))
+
+# bcrypt is CPU-bound; run it in worker processes so it doesn't block the event loop
+_BCRYPT_POOL = ProcessPoolExecutor(max_workers=os.cpu_count())
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+# Checked against on unknown usernames so login timing doesn't reveal which users exist
+_DUMMY_HASH = bcrypt.hashpw(b'x', bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
 security = HTTPBearer()
 
+# Authenticated users cached by id so valid tokens skip the Mongo lookup
+_user_cache: TTLCache = TTLCache(maxsize=10000, ttl=60)
+
 # Create the main app
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # WebSocket Manager
@@ -39,32 +84,177 @@ class ConnectionManager:
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}  # device_id: websocket
         self.device_connections: Dict[str, WebSocket] = {}  # Arduino devices
+        self._queues: Dict[str, asyncio.Queue] = {}  # per-user outbound frames
+        self._writers: Dict[str, asyncio.Task] = {}
+        self._closing: Set[asyncio.Task] = set()  # strong refs so close tasks aren't GC'd mid-flight
+        self._device_locks: Dict[str, asyncio.Lock] = {}  # serializes frames sent to each device
+        self._pending: List[dict] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
     
     async def connect(self, websocket: WebSocket, client_id: str, client_type: str = "user"):
         await websocket.accept()
-        if client_type == "device":
-            self.device_connections[client_id] = websocket
-        else:
-            self.active_connections[client_id] = websocket
-    
-    def disconnect(self, client_id: str, client_type: str = "user"):
-        if client_type == "device":
-            if client_id in self.device_connections:
-                del self.device_connections[client_id]
-        else:
-            if client_id in self.active_connections:
-                del self.active_connections[client_id]
+        async with self._lock:
+            if client_type == "device":
+                self.device_connections[client_id] = websocket
+            else:
+                self._remove_user(client_id)
+                queue = asyncio.Queue(maxsize=USER_QUEUE_SIZE)
+                self.active_connections[client_id] = websocket
+                self._queues[client_id] = queue
+                self._writers[client_id] = asyncio.create_task(self._writer(websocket, queue))
+    
+    async def disconnect(self, client_id: str, client_type: str = "user"):
+        async with self._lock:
+            if client_type == "device":
+                self.device_connections.pop(client_id, None)
+            else:
+                self._remove_user(client_id)
+    
+    def _remove_user(self, client_id: str) -> Optional[WebSocket]:
+        self._queues.pop(client_id, None)
+        writer = self._writers.pop(client_id, None)
+        if writer:
+            writer.cancel()
+        return self.active_connections.pop(client_id, None)
+    
+    def _kick(self, client_id: str):
+        websocket = self._remove_user(client_id)
+        if websocket:
+            logger.warning(f"Dropping slow dashboard connection {client_id}")
+            task = asyncio.create_task(self._close(websocket))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+    
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+    
+    async def _writer(self, websocket: WebSocket, queue: asyncio.Queue):
+        try:
+            while True:
+                payload = await queue.get()
+                await websocket.send_bytes(payload)
+        except Exception:
+            # Send failures surface as WebSocketDisconnect in the receive loop
+            pass
+    
+    def device_lock(self, device_id: str) -> asyncio.Lock:
+        return self._device_locks.setdefault(device_id, asyncio.Lock())
     
     async def send_to_device(self, device_id: str, message: dict):
-        if device_id in self.device_connections:
-            await self.device_connections[device_id].send_json(message)
+        async with self.device_lock(device_id):
+            connection = self.device_connections.get(device_id)
+            if connection:
+                await send_device_json(connection, message)
     
     async def broadcast_to_users(self, message: dict):
-        for connection in self.active_connections.values():
-            await connection.send_json(message)
+        self._pending.append(message)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush())
+    
+    async def _flush(self):
+        await asyncio.sleep(BROADCAST_BATCH_WINDOW)
+        events, self._pending = self._pending, []
+        if not events:
+            return
+        payload = orjson.dumps({'type': 'batch', 'events': events})
+        async with self._lock:
+            for client_id, queue in list(self._queues.items()):
+                try:
+                    queue.put_nowait(payload)
+                except asyncio.QueueFull:
+                    self._kick(client_id)
+
+async def send_device_json(websocket: WebSocket, message: dict):
+    # Text frames keep JSON control messages distinct from binary OTA chunks
+    await websocket.send_text(orjson.dumps(message).decode('utf-8'))
 
 manager = ConnectionManager()
 
+# Buffers sensor readings and writes them with insert_many
+class SensorDataWriter:
+    def __init__(self, flush_interval: float = 0.05, max_batch: int = 100, max_buffer: int = 10000):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_buffer = max_buffer  # cap on readings held while Mongo is unavailable
+        self._buffer: List[dict] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+    
+    def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        # Let the loop finish any in-flight insert instead of cancelling it, then drain the rest
+        self._stopping = True
+        self._wakeup.set()
+        if self._task:
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._buffer:
+            logger.error(f"Failed to flush sensor data on shutdown, {len(self._buffer)} readings lost")
+    
+    def add(self, doc: dict) -> bool:
+        # Reject readings BSON can't encode here, so one bad document never poisons a batch
+        try:
+            bson.encode(doc)
+        except (InvalidDocument, OverflowError):
+            logger.warning(f"Dropping unencodable sensor reading from device {doc.get('device_id')}")
+            return False
+        self._buffer.append(doc)
+        if len(self._buffer) >= self.max_batch:
+            self._wakeup.set()
+        return True
+    
+    async def flush(self):
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        try:
+            await db.sensor_data.insert_many(batch, ordered=False)
+        except ConnectionFailure:
+            # Transient (AutoReconnect, NetworkTimeout, ServerSelectionTimeoutError): retry the batch.
+            # After an ambiguous network error the server may already have stored it, and since
+            # sensor_data is a time-series collection (no unique _id index) and a standalone mongod
+            # has no retryable writes, such a batch can end up stored twice.
+            logger.exception(f"Failed to flush {len(batch)} sensor readings, will retry")
+            self._requeue(batch)
+        except BulkWriteError as e:
+            # Per-document write errors won't succeed on retry; the rest of the batch was stored
+            logger.error(f"Dropped {len(e.details.get('writeErrors', []))} sensor readings rejected by the server")
+        except Exception:
+            logger.exception(f"Dropped {len(batch)} sensor readings after a non-transient write error")
+    
+    def _requeue(self, docs: List[dict]):
+        self._buffer[:0] = docs
+        overflow = len(self._buffer) - self.max_buffer
+        if overflow > 0:
+            del self._buffer[:overflow]
+            logger.error(f"Sensor data buffer full, dropped {overflow} oldest readings")
+    
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stopping:
+                break
+            await self.flush()
+
+sensor_writer = SensorDataWriter()
+
+def _short_id() -> str:
+    # uuid4 as unpadded urlsafe base64: 22 chars instead of 36, smaller index keys
+    return base64.urlsafe_b64encode(uuid.uuid4().bytes).rstrip(b'=').decode('ascii')
+
 # Models
 class UserRegister(BaseModel):
     username: str
@@ -77,14 +267,14 @@ class UserLogin(BaseModel):
 
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=_short_id)
     username: str
     email: EmailStr
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class DeviceType(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=_short_id)
     name: str
     description: Optional[str] = None
     pins_config: List[Dict[str, Any]] = []  # [{pin: 'D1', type: 'digital', mode: 'output'}]
@@ -92,10 +282,10 @@ class DeviceType(BaseModel):
 
 class Device(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=_short_id)
     name: str
     device_type_id: str
-    auth_token: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    auth_token: str = Field(default_factory=_short_id)
     user_id: str
     status: str = "offline"  # online/offline
     last_seen: Optional[datetime] = None
@@ -110,18 +300,19 @@ class DeviceCreate(BaseModel):
 
 class FirmwareVersion(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=_short_id)
     device_type_id: str
     version: str
-    file_data: str  # base64 encoded binary
+    gridfs_id: str  # firmware binary stored in the 'firmware' GridFS bucket
     file_size: int
+    sha256: Optional[str] = None
     description: Optional[str] = None
     is_active: bool = True
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class SensorData(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=_short_id)
     device_id: str
     data: Dict[str, Any]
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -132,29 +323,64 @@ class PinControl(BaseModel):
     value: Any  # Can be int, bool, or string
 
 # Helper Functions
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+async def hash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    hashed = await loop.run_in_executor(_BCRYPT_POOL, bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+    return hashed.decode('utf-8')
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+async def verify_password(password: str, hashed: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_BCRYPT_POOL, bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+class TokenExpiredError(Exception):
+    pass
+
+def _b64url_encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+def _b64url_decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+# HS256 tokens only ever carry this header, so it is encoded once
+_JWT_HEADER = _b64url_encode(orjson.dumps({'alg': JWT_ALGORITHM, 'typ': 'JWT'}))
+_JWT_KEY = JWT_SECRET.encode('utf-8')
 
 def create_token(user_id: str) -> str:
-    payload = {
+    payload = _b64url_encode(orjson.dumps({
         'user_id': user_id,
-        'exp': datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
-    }
-    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+        'exp': int(time.time()) + JWT_EXPIRATION_HOURS * 3600
+    }))
+    signing_input = _JWT_HEADER + b'.' + payload
+    signature = hmac.digest(_JWT_KEY, signing_input, 'sha256')
+    return (signing_input + b'.' + _b64url_encode(signature)).decode('ascii')
+
+def decode_token(token: str) -> dict:
+    header, payload, signature = token.encode('ascii').split(b'.')
+    if header != _JWT_HEADER:
+        raise ValueError("Unsupported token header")
+    expected = hmac.digest(_JWT_KEY, header + b'.' + payload, 'sha256')
+    if not hmac.compare_digest(expected, _b64url_decode(signature)):
+        raise ValueError("Invalid token signature")
+    claims = orjson.loads(_b64url_decode(payload))
+    if claims['exp'] < time.time():
+        raise TokenExpiredError()
+    return claims
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         token = credentials.credentials
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = decode_token(token)
         user_id = payload.get('user_id')
+        cached = _user_cache.get(user_id)
+        if cached is not None:
+            return cached
         user = await db.users.find_one({'id': user_id}, {'_id': 0})
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
-        return User(**user)
-    except jwt.ExpiredSignatureError:
+        user = User(**user)
+        _user_cache[user_id] = user
+        return user
+    except TokenExpiredError:
         raise HTTPException(status_code=401, detail="Token expired")
     except Exception as e:
         raise HTTPException(status_code=401, detail="Invalid token")
@@ -162,21 +388,19 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
 # Auth Routes
 @api_router.post("/auth/register")
 async def register(user_data: UserRegister):
-    # Check if user exists
-    existing = await db.users.find_one({'$or': [{'username': user_data.username}, {'email': user_data.email}]}, {'_id': 0})
-    if existing:
-        raise HTTPException(status_code=400, detail="Username or email already exists")
-    
     user = User(
         username=user_data.username,
         email=user_data.email
     )
     
     doc = user.model_dump()
-    doc['password'] = hash_password(user_data.password)
-    doc['created_at'] = doc['created_at'].isoformat()
+    doc['password'] = await hash_password(user_data.password)
     
-    await db.users.insert_one(doc)
+    # Unique indexes on username and email reject duplicates atomically
+    try:
+        await db.users.insert_one(doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Username or email already exists")
     token = create_token(user.id)
     
     return {'user': user, 'token': token}
@@ -184,7 +408,10 @@ async def register(user_data: UserRegister):
 @api_router.post("/auth/login")
 async def login(credentials: UserLogin):
     user_doc = await db.users.find_one({'username': credentials.username}, {'_id': 0})
-    if not user_doc or not verify_password(credentials.password, user_doc['password']):
+    if not user_doc:
+        await verify_password(credentials.password, _DUMMY_HASH)
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    if not await verify_password(credentials.password, user_doc['password']):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     user = User(**user_doc)
@@ -196,17 +423,13 @@ async def login(credentials: UserLogin):
 @api_router.post("/device-types", response_model=DeviceType)
 async def create_device_type(device_type: DeviceType, current_user: User = Depends(get_current_user)):
     doc = device_type.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.device_types.insert_one(doc)
     return device_type
 
-@api_router.get("/device-types", response_model=List[DeviceType])
+@api_router.get("/device-types")
 async def get_device_types(current_user: User = Depends(get_current_user)):
     types = await db.device_types.find({}, {'_id': 0}).to_list(1000)
-    for t in types:
-        if isinstance(t['created_at'], str):
-            t['created_at'] = datetime.fromisoformat(t['created_at'])
-    return types
+    return ORJSONResponse(content=types)
 
 # Device Routes
 @api_router.post("/devices", response_model=Device)
@@ -218,32 +441,20 @@ async def create_device(device_data: DeviceCreate, current_user: User = Depends(
     )
     
     doc = device.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    if doc['last_seen']:
-        doc['last_seen'] = doc['last_seen'].isoformat()
     
     await db.devices.insert_one(doc)
     return device
 
-@api_router.get("/devices", response_model=List[Device])
+@api_router.get("/devices")
 async def get_devices(current_user: User = Depends(get_current_user)):
     devices = await db.devices.find({'user_id': current_user.id}, {'_id': 0}).to_list(1000)
-    for d in devices:
-        if isinstance(d['created_at'], str):
-            d['created_at'] = datetime.fromisoformat(d['created_at'])
-        if d.get('last_seen') and isinstance(d['last_seen'], str):
-            d['last_seen'] = datetime.fromisoformat(d['last_seen'])
-    return devices
+    return ORJSONResponse(content=devices)
 
 @api_router.get("/devices/{device_id}", response_model=Device)
 async def get_device(device_id: str, current_user: User = Depends(get_current_user)):
     device = await db.devices.find_one({'id': device_id, 'user_id': current_user.id}, {'_id': 0})
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
-    if isinstance(device['created_at'], str):
-        device['created_at'] = datetime.fromisoformat(device['created_at'])
-    if device.get('last_seen') and isinstance(device['last_seen'], str):
-        device['last_seen'] = datetime.fromisoformat(device['last_seen'])
     return Device(**device)
 
 @api_router.delete("/devices/{device_id}")
@@ -262,48 +473,89 @@ async def upload_firmware(
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_user)
 ):
-    file_content = await file.read()
-    file_data_b64 = base64.b64encode(file_content).decode('utf-8')
-    
-    firmware = FirmwareVersion(
-        device_type_id=device_type_id,
-        version=version,
-        file_data=file_data_b64,
-        file_size=len(file_content),
-        description=description
-    )
-    
-    doc = firmware.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
+    size = 0
+    hasher = hashlib.sha256()
+    upload = firmware_bucket.open_upload_stream(file.filename)
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > MAX_FIRMWARE_SIZE:
+                raise HTTPException(status_code=413, detail="Firmware file too large")
+            hasher.update(chunk)
+            await upload.write(chunk)
+        await upload.close()
+        
+        firmware = FirmwareVersion(
+            device_type_id=device_type_id,
+            version=version,
+            gridfs_id=str(upload._id),
+            file_size=size,
+            sha256=hasher.hexdigest(),
+            description=description
+        )
+        
+        doc = firmware.model_dump()
+        
+        await db.firmware_versions.insert_one(doc)
+    except BaseException:
+        # Don't leave GridFS files behind that no firmware version references
+        try:
+            if upload.closed:
+                await firmware_bucket.delete(upload._id)
+            else:
+                await upload.abort()
+        except Exception:
+            logger.exception(f"Failed to clean up GridFS upload {upload._id}")
+        raise
     
-    await db.firmware_versions.insert_one(doc)
     return {'id': firmware.id, 'version': firmware.version, 'size': firmware.file_size}
 
 @api_router.get("/firmware/{device_type_id}")
 async def get_firmware_versions(device_type_id: str, current_user: User = Depends(get_current_user)):
     versions = await db.firmware_versions.find(
         {'device_type_id': device_type_id, 'is_active': True},
-        {'_id': 0, 'file_data': 0}
+        {
+            '_id': 0, 'id': 1, 'device_type_id': 1, 'version': 1, 'file_size': 1,
+            'sha256': 1, 'description': 1, 'is_active': 1, 'created_at': 1
+        }
     ).to_list(1000)
     
-    for v in versions:
-        if isinstance(v['created_at'], str):
-            v['created_at'] = datetime.fromisoformat(v['created_at'])
-    
     return versions
 
+async def open_firmware_stream(firmware: dict):
+    try:
+        return await firmware_bucket.open_download_stream(ObjectId(firmware['gridfs_id']))
+    except NoFile:
+        raise HTTPException(status_code=410, detail="Firmware file is missing from storage")
+
 @api_router.get("/firmware/download/{firmware_id}")
 async def download_firmware(firmware_id: str, current_user: User = Depends(get_current_user)):
-    firmware = await db.firmware_versions.find_one({'id': firmware_id}, {'_id': 0})
+    firmware = await db.firmware_versions.find_one(
+        {'id': firmware_id},
+        {'_id': 0, 'id': 1, 'version': 1, 'gridfs_id': 1, 'file_size': 1, 'sha256': 1}
+    )
     if not firmware:
         raise HTTPException(status_code=404, detail="Firmware not found")
     
-    return {
-        'id': firmware['id'],
-        'version': firmware['version'],
-        'file_data': firmware['file_data'],
-        'file_size': firmware['file_size']
-    }
+    if not firmware.get('gridfs_id'):
+        raise HTTPException(status_code=410, detail="Firmware predates GridFS storage; run migrate_firmware_to_gridfs.py")
+    
+    grid_out = await open_firmware_stream(firmware)
+    
+    async def iter_chunks():
+        while chunk := await grid_out.readchunk():
+            yield chunk
+    
+    return StreamingResponse(
+        iter_chunks(),
+        media_type='application/octet-stream',
+        headers={
+            'Content-Length': str(firmware['file_size']),
+            'X-Firmware-Id': firmware['id'],
+            'X-Firmware-Version': firmware['version'],
+            'X-Firmware-Sha256': firmware.get('sha256') or ''
+        }
+    )
 
 @api_router.post("/firmware/ota/{device_id}/{firmware_id}")
 async def trigger_ota_update(device_id: str, firmware_id: str, current_user: User = Depends(get_current_user)):
@@ -311,18 +563,50 @@ async def trigger_ota_update(device_id: str, firmware_id: str, current_user: Use
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
     
-    firmware = await db.firmware_versions.find_one({'id': firmware_id}, {'_id': 0})
+    firmware = await db.firmware_versions.find_one(
+        {'id': firmware_id},
+        {'_id': 0, 'id': 1, 'version': 1, 'gridfs_id': 1, 'file_size': 1, 'sha256': 1}
+    )
     if not firmware:
         raise HTTPException(status_code=404, detail="Firmware not found")
+    if not firmware.get('gridfs_id'):
+        raise HTTPException(status_code=410, detail="Firmware predates GridFS storage; run migrate_firmware_to_gridfs.py")
     
-    # Send OTA command to device via WebSocket
-    await manager.send_to_device(device_id, {
-        'type': 'ota_update',
-        'firmware_id': firmware_id,
-        'version': firmware['version'],
-        'file_data': firmware['file_data'],
-        'file_size': firmware['file_size']
-    })
+    if device_id not in manager.device_connections:
+        raise HTTPException(status_code=409, detail="Device is not connected")
+    
+    # Hold the device lock for the whole transfer so no other frame lands inside the binary stream
+    async with manager.device_lock(device_id):
+        connection = manager.device_connections.get(device_id)
+        if not connection:
+            raise HTTPException(status_code=409, detail="Device is not connected")
+        
+        grid_out = await open_firmware_stream(firmware)
+        
+        # Stream firmware to the device: ota_begin, binary chunks, then ota_end with a checksum
+        try:
+            await send_device_json(connection, {
+                'type': 'ota_begin',
+                'firmware_id': firmware_id,
+                'version': firmware['version'],
+                'total': firmware['file_size'],
+                'chunk_size': OTA_CHUNK_SIZE,
+                'sha256': firmware.get('sha256')
+            })
+            
+            crc = 0
+            while chunk := await grid_out.read(OTA_CHUNK_SIZE):
+                crc = zlib.crc32(chunk, crc)
+                await connection.send_bytes(chunk)
+            
+            await send_device_json(connection, {
+                'type': 'ota_end',
+                'firmware_id': firmware_id,
+                'crc32': crc
+            })
+        except Exception:
+            logger.exception(f"OTA transfer to device {device_id} failed")
+            raise HTTPException(status_code=502, detail="OTA transfer to device failed")
     
     return {'message': 'OTA update triggered', 'version': firmware['version']}
 
@@ -351,13 +635,9 @@ async def get_sensor_data(device_id: str, limit: int = 100, current_user: User =
     data = await db.sensor_data.find(
         {'device_id': device_id},
         {'_id': 0}
-    ).sort('timestamp', -1).limit(limit).to_list(limit)
+    ).sort('timestamp', -1).hint(SENSOR_DATA_INDEX).limit(limit).to_list(limit)
     
-    for d in data:
-        if isinstance(d['timestamp'], str):
-            d['timestamp'] = datetime.fromisoformat(d['timestamp'])
-    
-    return data
+    return ORJSONResponse(content=data)
 
 # WebSocket for Users (Dashboard)
 @app.websocket("/ws/dashboard/{user_id}")
@@ -368,7 +648,7 @@ async def websocket_dashboard(websocket: WebSocket, user_id: str):
             data = await websocket.receive_text()
             # Handle any user commands
     except WebSocketDisconnect:
-        manager.disconnect(user_id, "user")
+        await manager.disconnect(user_id, "user")
 
 # WebSocket for Arduino Devices
 @app.websocket("/ws/device/{device_id}/{auth_token}")
@@ -384,7 +664,7 @@ async def websocket_device(websocket: WebSocket, device_id: str, auth_token: str
     # Update device status to online
     await db.devices.update_one(
         {'id': device_id},
-        {'$set': {'status': 'online', 'last_seen': datetime.now(timezone.utc).isoformat()}}
+        {'$set': {'status': 'online'}, '$currentDate': {'last_seen': True}}
     )
     
     # Broadcast device status to users
@@ -397,7 +677,7 @@ async def websocket_device(websocket: WebSocket, device_id: str, auth_token: str
     try:
         while True:
             data = await websocket.receive_text()
-            message = json.loads(data)
+            message = orjson.loads(data)
             
             if message.get('type') == 'sensor_data':
                 # Save sensor data
@@ -406,8 +686,7 @@ async def websocket_device(websocket: WebSocket, device_id: str, auth_token: str
                     data=message.get('data', {})
                 )
                 doc = sensor_data.model_dump()
-                doc['timestamp'] = doc['timestamp'].isoformat()
-                await db.sensor_data.insert_one(doc)
+                sensor_writer.add(doc)
                 
                 # Broadcast to users
                 await manager.broadcast_to_users({
@@ -432,12 +711,12 @@ async def websocket_device(websocket: WebSocket, device_id: str, auth_token: str
                 })
     
     except WebSocketDisconnect:
-        manager.disconnect(device_id, "device")
+        await manager.disconnect(device_id, "device")
         
         # Update device status to offline
         await db.devices.update_one(
             {'id': device_id},
-            {'$set': {'status': 'offline', 'last_seen': datetime.now(timezone.utc).isoformat()}}
+            {'$set': {'status': 'offline'}, '$currentDate': {'last_seen': True}}
         )
         
         # Broadcast device status to users
@@ -463,6 +742,31 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    await db.users.create_index("id", unique=True)
+    await db.users.create_index("username", unique=True)
+    await db.users.create_index("email", unique=True)
+    await db.devices.create_index([("user_id", 1), ("id", 1)])
+    await db.devices.create_index([("id", 1), ("auth_token", 1)])
+    # New deployments store sensor readings as a time-series collection (compressed buckets);
+    # an existing regular collection is left as-is
+    try:
+        await db.create_collection(
+            "sensor_data",
+            timeseries={'timeField': 'timestamp', 'metaField': 'device_id', 'granularity': 'seconds'}
+        )
+    except CollectionInvalid:
+        pass
+    await db.sensor_data.create_index(SENSOR_DATA_INDEX)
+    await db.firmware_versions.create_index([("device_type_id", 1), ("is_active", 1)])
+
+@app.on_event("startup")
+async def start_sensor_writer():
+    sensor_writer.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    await sensor_writer.stop()
+    await client.close()
+    _BCRYPT_POOL.shutdown(wait=False)
\ No newline at end of file
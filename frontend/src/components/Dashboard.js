@@ -12,6 +12,7 @@ import { Activity, Cpu, Upload, LogOut, Settings } from 'lucide-react';
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 const WS_URL = BACKEND_URL.replace('https://', 'wss://').replace('http://', 'ws://');
+const textDecoder = new TextDecoder();
 
 export default function Dashboard({ user, onLogout }) {
   const [devices, setDevices] = useState([]);
@@ -36,6 +37,7 @@ export default function Dashboard({ user, onLogout }) {
     if (wsRef.current?.readyState === WebSocket.OPEN) return;
 
     const ws = new WebSocket(`${WS_URL}/ws/dashboard/${user?.id || 'user'}`);
+    ws.binaryType = 'arraybuffer';
 
     ws.onopen = () => {
       console.log('WebSocket connected');
@@ -43,8 +45,13 @@ export default function Dashboard({ user, onLogout }) {
     };
 
     ws.onmessage = (event) => {
-      const message = JSON.parse(event.data);
-      handleWebSocketMessage(message);
+      const raw = typeof event.data === 'string' ? event.data : textDecoder.decode(event.data);
+      const message = JSON.parse(raw);
+      if (message.type === 'batch') {
+        message.events.forEach(handleWebSocketMessage);
+      } else {
+        handleWebSocketMessage(message);
+      }
     };
 
     ws.onerror = (error) => {
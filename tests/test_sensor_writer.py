@@ -0,0 +1,104 @@
+import asyncio
+from datetime import datetime, timezone
+
+import bson
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError, OperationFailure
+
+import server
+
+
+class FakeCollection:
+    """Stores documents like insert_many would, failing with queued errors first."""
+
+    def __init__(self):
+        self.docs = []
+        self.errors = []
+
+    async def insert_many(self, batch, ordered=True):
+        for doc in batch:
+            bson.encode(doc)
+        if self.errors:
+            raise self.errors.pop(0)
+        self.docs.extend(batch)
+
+
+class FakeDB:
+    def __init__(self):
+        self.sensor_data = FakeCollection()
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = FakeDB()
+    monkeypatch.setattr(server, 'db', fake)
+    return fake
+
+
+def _reading(i):
+    return {'device_id': 'dev-1', 'data': {'value': i}, 'timestamp': datetime.now(timezone.utc)}
+
+
+def test_unencodable_reading_is_rejected(fake_db):
+    writer = server.SensorDataWriter()
+    assert not writer.add({'device_id': 'dev-1', 'data': {'a\x00b': 1}})
+    for i in range(200):
+        assert writer.add(_reading(i))
+    asyncio.run(writer.flush())
+    assert len(fake_db.sensor_data.docs) == 200
+    assert writer._buffer == []
+
+
+def test_transient_error_requeues_batch(fake_db):
+    writer = server.SensorDataWriter()
+    fake_db.sensor_data.errors.append(AutoReconnect('connection reset'))
+    for i in range(3):
+        writer.add(_reading(i))
+    asyncio.run(writer.flush())
+    assert fake_db.sensor_data.docs == []
+    assert len(writer._buffer) == 3
+    writer.add(_reading(3))
+    asyncio.run(writer.flush())
+    assert [d['data']['value'] for d in fake_db.sensor_data.docs] == [0, 1, 2, 3]
+
+
+def test_write_errors_are_dropped(fake_db):
+    writer = server.SensorDataWriter()
+    fake_db.sensor_data.errors.append(BulkWriteError({'writeErrors': [{'index': 0, 'code': 2}]}))
+    writer.add(_reading(0))
+    asyncio.run(writer.flush())
+    assert writer._buffer == []
+
+
+def test_non_transient_error_drops_batch(fake_db):
+    writer = server.SensorDataWriter()
+    fake_db.sensor_data.errors.append(OperationFailure('not authorized'))
+    writer.add(_reading(0))
+    asyncio.run(writer.flush())
+    assert writer._buffer == []
+    writer.add(_reading(1))
+    asyncio.run(writer.flush())
+    assert [d['data']['value'] for d in fake_db.sensor_data.docs] == [1]
+
+
+def test_requeue_drops_oldest_past_max_buffer(fake_db):
+    writer = server.SensorDataWriter(max_buffer=5)
+    fake_db.sensor_data.errors.append(AutoReconnect('connection reset'))
+    for i in range(8):
+        writer.add(_reading(i))
+    asyncio.run(writer.flush())
+    assert [d['data']['value'] for d in writer._buffer] == [3, 4, 5, 6, 7]
+
+
+def test_stop_drains_buffer(fake_db):
+    async def run():
+        writer = server.SensorDataWriter(flush_interval=10)
+        writer.start()
+        for i in range(5):
+            writer.add(_reading(i))
+        await writer.stop()
+        return writer
+
+    writer = asyncio.run(run())
+    assert writer._buffer == []
+    assert len(fake_db.sensor_data.docs) == 5
@@ -0,0 +1,102 @@
+import asyncio
+import base64
+import time
+
+import jwt
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+import server
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _auth(token: str) -> HTTPException:
+    credentials = HTTPAuthorizationCredentials(scheme='Bearer', credentials=token)
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(server.get_current_user(credentials))
+    return exc_info.value
+
+
+def _pyjwt_token(exp_offset: int = 60) -> str:
+    return jwt.encode(
+        {'user_id': 'user-1', 'exp': int(time.time()) + exp_offset},
+        server.JWT_SECRET,
+        algorithm='HS256'
+    )
+
+
+def test_token_decodes_with_pyjwt():
+    token = server.create_token('user-1')
+    claims = jwt.decode(token, server.JWT_SECRET, algorithms=['HS256'])
+    assert claims['user_id'] == 'user-1'
+
+
+def test_pyjwt_token_decodes():
+    claims = server.decode_token(_pyjwt_token())
+    assert claims['user_id'] == 'user-1'
+
+
+def test_round_trip():
+    claims = server.decode_token(server.create_token('user-1'))
+    assert claims['user_id'] == 'user-1'
+    assert claims['exp'] > time.time()
+
+
+def test_expired_token():
+    with pytest.raises(server.TokenExpiredError):
+        server.decode_token(_pyjwt_token(exp_offset=-60))
+    error = _auth(_pyjwt_token(exp_offset=-60))
+    assert error.status_code == 401
+    assert error.detail == "Token expired"
+
+
+def test_tampered_payload_rejected():
+    header, _, signature = server.create_token('user-1').split('.')
+    payload = _b64(b'{"user_id":"admin","exp":9999999999}')
+    with pytest.raises(ValueError):
+        server.decode_token(f'{header}.{payload}.{signature}')
+
+
+def test_tampered_signature_rejected():
+    header, payload, _ = server.create_token('user-1').split('.')
+    with pytest.raises(ValueError):
+        server.decode_token(f'{header}.{payload}.{_b64(b"0" * 32)}')
+
+
+def test_other_secret_rejected():
+    token = jwt.encode({'user_id': 'user-1', 'exp': int(time.time()) + 60}, 'other-secret', algorithm='HS256')
+    with pytest.raises(ValueError):
+        server.decode_token(token)
+
+
+def test_foreign_header_rejected():
+    token = jwt.encode(
+        {'user_id': 'user-1', 'exp': int(time.time()) + 60},
+        server.JWT_SECRET,
+        algorithm='HS384'
+    )
+    with pytest.raises(ValueError):
+        server.decode_token(token)
+    _, payload, signature = server.create_token('user-1').split('.')
+    header = _b64(b'{"alg":"none","typ":"JWT"}')
+    assert _auth(f'{header}.{payload}.{signature}').status_code == 401
+
+
+@pytest.mark.parametrize('token', [
+    '',
+    'abc',
+    'a.b',
+    'a.b.c.d',
+    'ä.b.c',
+    server.create_token('user-1') + 'é',
+    server.create_token('user-1')[:-1] + '===',
+    server.create_token('user-1').rsplit('.', 1)[0] + '.a',
+])
+def test_malformed_token_is_unauthorized(token):
+    error = _auth(token)
+    assert error.status_code == 401
+    assert error.detail == "Invalid token"